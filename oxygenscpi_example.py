@@ -41,9 +41,8 @@ time.sleep(1)
 
 # Record Data File for 5 Seconds
 print("Recording data...")
-mDevice.storeSetFileName("Testfile 1")
-mDevice.storeStart()
-time.sleep(5)
+mDevice.storeStart("Testfile 1")
+mDevice.storeWait(5)
 mDevice.storeStop()
 print("Recording stopped.")
 
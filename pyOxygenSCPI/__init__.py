@@ -6,3 +6,4 @@ __copyright__ = "Copyright 2021 DEWETRON GmbH"
 __version__ = '0.0.1'
 
 from .oxygenscpi import OxygenSCPI
+from .asyncoxygenscpi import AsyncOxygenSCPI
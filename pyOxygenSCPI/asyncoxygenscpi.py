@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+"""
+asyncio variant of the Oxygen SCPI control class
+"""
+
+import asyncio
+import logging
+
+from .oxygenscpi import (_OxygenSCPIBase, _block_missing_bytes, _format_channel_list,
+                         _DIMS_DIRTY, _CMD_IDN, _CMD_VER, _CMD_GET_VALUES,
+                         _CMD_ELOG_FETCH, _CMD_OPC, _CMD_HEADERS_OFF,
+                         _CMD_ACQU_START, _CMD_ACQU_STOP, _CMD_STOR_START,
+                         _CMD_STOR_STOP, _CMD_STOR_STATE, _CMD_ELOG_START,
+                         _CMD_ELOG_STOP,
+                         _TPL_RATE, _TPL_NUM_NUMBER, _TPL_ELOG_PERIOD,
+                         _strip_header, np)
+
+log = logging.getLogger('oxygenscpi')
+
+class AsyncOxygenSCPI(_OxygenSCPIBase):
+    """
+    Oxygen SCPI control class based on asyncio streams
+
+    Allows to query several devices concurrently, e.g. with asyncio.gather.
+    All public methods are coroutines and behave like the OxygenSCPI methods
+    of the same name. Only a subset of the OxygenSCPI interface is available,
+    DataStream and ChannelProperties are not supported.
+    """
+    def __init__(self, ip_addr, tcp_port = 10001, timeout = 5, tcp_nodelay = True,
+                 block_size = 1024*1024):
+        super().__init__(ip_addr, tcp_port, timeout, tcp_nodelay, block_size)
+        self._reader = None
+        self._writer = None
+        self._io_lock = None
+        self._conn_lock = None
+
+    async def connect(self):
+        async with self._connLock():
+            return await self._connect()
+
+    async def _connect(self):
+        for numTry in range(1, self._CONN_NUM_TRY+1):
+            try:
+                # The limit is the read size, longer lines are read in chunks
+                reader, writer = await asyncio.wait_for(
+                    asyncio.open_connection(self._ip_addr, self._tcp_port,
+                                            limit=self._TCP_BLOCK_SIZE),
+                    self._CONN_TIMEOUT)
+            except ConnectionRefusedError as msg:
+                template = "Connection to {!s}:{:d} refused: {!s}"
+                log.error(template.format(self._ip_addr, self._tcp_port, msg))
+                return False
+            except (OSError, asyncio.TimeoutError) as msg:
+                if numTry < self._CONN_NUM_TRY:
+                    continue
+                template = "Connection to {!s}:{:d} failed: {!s}"
+                log.error(template.format(self._ip_addr, self._tcp_port, msg))
+                return False
+            sock = writer.get_extra_info('socket')
+            if sock is not None:
+                self._configureSocket(sock)
+            self._reader = reader
+            self._writer = writer
+            # Not via headersOff and getVersion, these would wait for the
+            # connection lock held here
+            self._headersActive = False
+            await self._transfer(_CMD_HEADERS_OFF)
+            self._parseVersion(await self._transfer(_CMD_VER, True))
+            return self._writer is not None
+        return False
+
+    async def _ensureConnected(self):
+        """ Connect unless connected, concurrent callers share one connection
+        """
+        if self._writer is None:
+            async with self._connLock():
+                if self._writer is None:
+                    return await self._connect()
+        return True
+
+    async def disconnect(self):
+        writer = self._writer
+        if writer is None:
+            return
+        # Cleared first, so waiting callers do not use the closing writer
+        self._reader = None
+        self._writer = None
+        try:
+            writer.close()
+            if hasattr(writer, 'wait_closed'):
+                await writer.wait_closed()
+        except OSError as msg:
+            log.error("Error Shutting Down: %s", msg)
+
+    def _ioLock(self):
+        # Created on first use, so it belongs to the running event loop
+        if self._io_lock is None:
+            self._io_lock = asyncio.Lock()
+        return self._io_lock
+
+    def _connLock(self):
+        if self._conn_lock is None:
+            self._conn_lock = asyncio.Lock()
+        return self._conn_lock
+
+    async def _sendRaw(self, cmd):
+        """ Send a command to the device
+
+        cmd is either a str or pre-encoded, LF terminated bytes
+        """
+        if not await self._ensureConnected():
+            return False
+        return await self._transfer(self._encodeCmd(cmd))
+
+    async def _sendBatch(self, cmds):
+        """ Send several commands with a single write
+        """
+        return await self._sendRaw(b''.join(map(self._encodeCmd, cmds)))
+
+    async def _sendAndWait(self, cmd):
+        """ Send a command and wait until the device has completed it
+        """
+        cmd = self._encodeCmd(cmd)
+        ret = await self._askRaw(cmd + _CMD_OPC)
+        return isinstance(ret, bytes) and ret.strip().endswith(b'1')
+
+    async def _askRaw(self, cmd):
+        """ Send a query to the device and return the response
+
+        cmd is either a str or pre-encoded, LF terminated bytes
+        """
+        if not await self._ensureConnected():
+            return False
+        return await self._transfer(self._encodeCmd(cmd), True)
+
+    async def _transfer(self, cmd, has_response=False):
+        """ Write encoded command(s) and read the response if there is one
+        """
+        async with self._ioLock():
+            # May have been disconnected while waiting for the lock
+            if self._writer is None:
+                return False
+            try:
+                self._writer.write(cmd)
+                await self._writer.drain()
+                if not has_response:
+                    return True
+                return await asyncio.wait_for(self._readResponse(), self._CONN_TIMEOUT)
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError) as msg:
+                log.error("{!s}".format(msg))
+                await self.disconnect()
+        return False
+
+    async def _readResponse(self):
+        """ Read one LF terminated response from the device
+        """
+        reader = self._reader
+        chunks = []
+        while True:
+            try:
+                chunks.append(await reader.readuntil(b'\n'))
+                break
+            except asyncio.LimitOverrunError as err:
+                # Line longer than the stream limit, take what is buffered
+                chunks.append(await reader.readexactly(err.consumed))
+        answerMsg = b''.join(chunks) if len(chunks) > 1 else chunks[0]
+        missing = _block_missing_bytes(answerMsg)
+        if missing > 0:
+            answerMsg += await reader.readexactly(missing)
+        return answerMsg
+
+    async def getIdn(self):
+        ret = await self._askRaw(_CMD_IDN)
+        if isinstance(ret, bytes):
+            return ret.decode().strip()
+        return False
+
+    async def getVersion(self):
+        return self._parseVersion(await self._askRaw(_CMD_VER))
+
+    async def headersOff(self):
+        self._headersActive = False
+        return await self._sendRaw(_CMD_HEADERS_OFF)
+
+    async def setRate(self, rate=500, wait=False):
+        cmd = _TPL_RATE % rate
+        if wait:
+            return await self._sendAndWait(cmd)
+        return await self._sendRaw(cmd)
+
+    async def setTransferChannels(self, channelNames, includeRelTime=False, includeAbsTime=False, verify=True):
+        """Sets the channels to be transfered within the numeric system
+
+        See OxygenSCPI.setTransferChannels
+        """
+        channelNames = self._transferChannelNames(channelNames, includeRelTime, includeAbsTime)
+        ret = await self._sendBatch(self._transferChannelsCmds(channelNames))
+        if not verify:
+            if ret:
+                self._setTransferChannelList(channelNames)
+            return ret
+        # Read back actual set channel names
+        ret = await self._askRaw(':NUM:NORMAL:ITEMS?')
+        if isinstance(ret, bytes):
+            if not self._parseTransferChannels(ret, len(channelNames)):
+                # Some channels were not accepted, correct the number
+                if not await self.setNumberChannels():
+                    return False
+            return True
+        return False
+
+    async def setNumberChannels(self, number=None):
+        if number is None:
+            number = len(self.channelList)
+        return await self._sendRaw(_TPL_NUM_NUMBER % number)
+
+    async def getValueDimensions(self):
+        return self._parseValueDimensions(await self._askRaw(':NUM:NORM:DIMS?'))
+
+    async def getValues(self):
+        """Queries the actual values from the numeric system
+
+        See OxygenSCPI.getValues
+        """
+        if self._value_dimension is _DIMS_DIRTY and not await self.getValueDimensions():
+            return False
+        return self._parseValues(await self._askRaw(_CMD_GET_VALUES))
+
+    async def setElogChannels(self, channel_names, verify=True):
+        """Sets the channels to be transfered within the ELOG system
+
+        See OxygenSCPI.setElogChannels
+        """
+        if not self._has_v1_7:
+            log.warning('SCPI Version 1.7 or higher required')
+            return False
+        channel_list_str = _format_channel_list(channel_names)
+        ret = await self._sendAndWait(':ELOG:ITEMS {:s}'.format(channel_list_str))
+        if not verify:
+            self.elogChannelList = list(channel_names)
+            return ret and len(channel_names) > 0
+        return self._parseElogChannels(await self._askRaw(':ELOG:ITEMS?'))
+
+    async def startElog(self):
+        return await self._sendRaw(_CMD_ELOG_START)
+
+    async def setElogPeriod(self, period):
+        return await self._sendRaw(_TPL_ELOG_PERIOD % period)
+
+    async def stopElog(self):
+        return await self._sendRaw(_CMD_ELOG_STOP)
+
+    async def fetchElog(self, as_ndarray=False):
+        """Fetches the values logged by the ELOG system since the last fetch
+
+        See OxygenSCPI.fetchElog
+        """
+        if as_ndarray and np is None:
+            raise NotImplementedError("fetchElog(as_ndarray=True) requires NumPy")
+        return self._parseElog(await self._askRaw(_CMD_ELOG_FETCH), as_ndarray)
+
+    async def getStoreState(self):
+        ret = await self._askRaw(_CMD_STOR_STATE)
+        if isinstance(ret, bytes):
+            return _strip_header(ret).decode()
+        return False
+
+    async def storeStart(self, file_name=None, wait=False):
+        """Starts the storing (recording) action or resumes if it was paused.
+
+        See OxygenSCPI.storeStart
+        """
+        cmds = [_CMD_STOR_START]
+        if file_name is not None:
+            cmds.insert(0, ':STOR:FILE:NAME "{:s}"'.format(file_name))
+        if wait:
+            return await self._sendAndWait(b''.join(map(self._encodeCmd, cmds)))
+        return await self._sendBatch(cmds)
+
+    async def storeStop(self):
+        return await self._sendRaw(_CMD_STOR_STOP)
+
+    async def startAcquisition(self):
+        return await self._sendRaw(_CMD_ACQU_START)
+
+    async def stopAcquisition(self):
+        return await self._sendRaw(_CMD_ACQU_STOP)
@@ -5,59 +5,493 @@ Created on Sun Jul 30 17:53:14 2017
 @author: Michael Oberhofer
 """
 
+import os
+import re
+import select
 import socket
+import sys
 import logging
+import queue
+import threading
 import datetime as dt
+from contextlib import contextmanager
 from enum import Enum
-from struct import unpack
-from time import sleep
+from functools import lru_cache
+from struct import Struct
+from time import monotonic
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 log = logging.getLogger('oxygenscpi')
 
-def is_minimum_version(version, min_version):
+# Quoted items of a channel list response, e.g. "AI 1/1","AI 1/2"
+_QUOTED_RE = re.compile(rb'"([^"]*)"')
+_STRIP_QUOTES = str.maketrans('', '', '"')
+_STRIP_PARENS_QUOTES = str.maketrans('', '', '()"')
+# Protocol version within the *VER? response
+_VER_RE = re.compile(rb'RC_SCPI,"(\d+)\.(\d+)')
+
+# Frequently sent commands, pre-encoded
+_CMD_IDN = b'*IDN?\n'
+_CMD_VER = b'*VER?\n'
+_CMD_GET_VALUES = b':NUM:NORM:VAL?\n'
+_CMD_ELOG_FETCH = b':ELOG:FETCH?\n'
+_CMD_OPC = b'*OPC?\n'
+_CMD_RST = b'*RST\n'
+_CMD_HEADERS_OFF = b':COMM:HEAD OFF\n'
+_CMD_ACQU_START = b':ACQU:START\n'
+_CMD_ACQU_STOP = b':ACQU:STOP\n'
+_CMD_ACQU_RESTART = b':ACQU:RESTART\n'
+_CMD_ACQU_STATE = b':ACQU:STAT?\n'
+_CMD_STOR_START = b':STOR:START\n'
+_CMD_STOR_PAUSE = b':STOR:PAUSE\n'
+_CMD_STOR_STOP = b':STOR:STOP\n'
+_CMD_STOR_STATE = b':STOR:STAT?\n'
+_CMD_ELOG_START = b':ELOG:START\n'
+_CMD_ELOG_STOP = b':ELOG:STOP\n'
+_CMD_DST_RESET = b':DST:RESET\n'
+_TPL_PROP_GET = b':CHANNEL:PROP? "%s","%s"\n'
+_TPL_PROP_SET = b':CHANNEL:PROP "%s","%s","%s"\n'
+_TPL_RATE = b':RATE %dms\n'
+_TPL_NUM_NUMBER = b':NUM:NORMAL:NUMBER %d\n'
+_TPL_NUM_DIM_MAX = b':NUM:NORMAL:DIM%d MAX\n'
+_TPL_ELOG_PERIOD = b':ELOG:PERIOD %f\n'
+_TPL_DST_PORT = b':DST:PORT%d %d\n'
+_TPL_DST_STATE = b':DST:STAT%d?\n'
+_TPL_DST_TRIG = b':DST:TRIG%d %s\n'
+_TPL_DST_CMD = b':DST:%s %d\n'
+_DST_CMDS_ALL = {
+    b'INIT': b':DST:INIT ALL\n',
+    b'START': b':DST:START ALL\n',
+    b'STOP': b':DST:STOP ALL\n',
+}
+
+# Marks value dimensions that have to be queried before the next transfer
+_DIMS_DIRTY = object()
+
+# Gathering writes (not available on Windows), larger batches are joined
+_HAS_SENDMSG = hasattr(socket.socket, 'sendmsg')
+_MAX_SEND_PARTS = 64
+
+# Receive size limit, larger sizes cost more per call than they save
+_RECV_SIZE_MAX = 64*1024
+# Response prefix long enough for a block header (e.g. :NUM:VAL #18...)
+_BLOCK_HEAD_SIZE = 64
+
+# Detect a silently dropped connection after about a minute of idle time
+# (idle time, probe interval and count are not available on all platforms)
+_KEEPALIVE_OPTIONS = [
+    (getattr(socket, name), value)
+    for name, value in (('TCP_KEEPIDLE', 30), ('TCP_KEEPINTVL', 10), ('TCP_KEEPCNT', 3))
+    if hasattr(socket, name)
+]
+
+# strptime is slow and fromisoformat before Python 3.11 only knows 3 or 6
+# sub-second digits
+_TIMESTAMP_RE = re.compile(
+    r'"?(\d{4})-(\d\d)-(\d\d)T(\d\d):(\d\d):(\d\d)(?:\.(\d+))?([+-])(\d\d):?(\d\d)"?$')
+_TZ_CACHE = {}
+
+def _parse_timestamp_re(val):
     """
-    Performs a version check
+    Parse DateTime "2017-10-10T12:16:52.33136+02:00"
+    Variable length of Sub-Seconds
     """
-    if version[0] > min_version[0]:
-        return True
-    if version[0] < min_version[0]:
-        return False
-    return version[1] >= min_version[1]
+    match = _TIMESTAMP_RE.match(val)
+    if match is None:
+        raise ValueError('Invalid timestamp: {:s}'.format(val))
+    year, month, day, hour, minute, second, frac, sign, tz_h, tz_m = match.groups()
+    tz_key = (sign, tz_h, tz_m)
+    tzinfo = _TZ_CACHE.get(tz_key)
+    if tzinfo is None:
+        offset = dt.timedelta(hours=int(tz_h), minutes=int(tz_m))
+        tzinfo = _TZ_CACHE[tz_key] = dt.timezone(-offset if sign == '-' else offset)
+    microsecond = int(frac[:6].ljust(6, '0')) if frac else 0
+    return dt.datetime(int(year), int(month), int(day), int(hour), int(minute),
+                       int(second), microsecond, tzinfo)
+
+if sys.version_info >= (3, 11):
+    def _parse_timestamp(val):
+        """
+        Parse DateTime "2017-10-10T12:16:52.33136+02:00"
+        """
+        return dt.datetime.fromisoformat(val.translate(_STRIP_QUOTES))
+else:
+    _parse_timestamp = _parse_timestamp_re
 
-class OxygenSCPI:
+def _parse_text_token(val):
     """
-    Oxygen SCPI control class
+    Value of a non-numeric token, the timestamp if it is one, else the str
+    """
+    val = val.decode()
+    try:
+        return _parse_timestamp(val)
+    except ValueError:
+        return val
+
+def _parse_value_token(val):
+    """
+    Value of a token of any type, numbers are parsed as float
+    """
+    try:
+        return float(val)
+    except ValueError:
+        return _parse_text_token(val)
+
+@lru_cache(maxsize=16)
+def _float32_struct(byteorder, num_values):
+    """
+    Compiled unpacker for an array of float32 values, used without NumPy
+    """
+    return Struct(byteorder + 'f' * num_values)
+
+def _prop_field(ret, idx):
+    """
+    Field of a channel property value, e.g. idx 1 of (SCALAR,20000.0,"Hz")
+    """
+    return ret.split(',')[idx].translate(_STRIP_PARENS_QUOTES)
+
+def _block_length(head):
+    """
+    Size of a response consisting of a definite length block (e.g. #18abcdefgh)
+    including its LF, 0 for other responses. Only the block header is read,
+    so head may be just the first bytes of the response.
+    """
+    # Skip the header if present (e.g. :NUM:VAL #18abcdefgh)
+    start = head.find(b' ') + 1 if head.startswith(b':') else 0
+    if head[start:start+1] != b'#':
+        return 0
+    numlenchars = head[start+1:start+2]
+    if not numlenchars.isdigit() or numlenchars == b'0':
+        return 0
+    numlenchars = int(numlenchars)
+    array_length = head[start+2:start+2+numlenchars]
+    if len(array_length) < numlenchars or not array_length.isdigit():
+        return 0
+    return start + 2 + numlenchars + int(array_length) + 1
+
+def _block_missing_bytes(line):
+    """
+    Number of bytes missing from a definite length block (e.g. #18abcdefgh)
+    after reading the first line of a response
+    """
+    size = _block_length(line[:_BLOCK_HEAD_SIZE])
+    return size - len(line) if size else 0
+
+def _parse_numeric(data):
     """
-    def __init__(self, ip_addr, tcp_port = 10001, timeout = 5):
+    Parse comma separated numbers with NumPy
+    Returns None if not all values are numeric (blank fields included)
+    """
+    # Unlike np.fromstring, the conversion of the tokens fails on blank fields
+    try:
+        return np.array(data.split(b','), dtype=float)
+    except ValueError:
+        return None
+
+def _strip_header(ret):
+    """
+    Payload of a response without header, e.g. b':STOR:STAT Stopped\n' -> b'Stopped'
+    """
+    if ret.startswith(b':'):
+        ret = ret.partition(b' ')[2]
+    return ret.strip()
+
+def _parse_channel_list(ret):
+    """
+    Parse the channel names of a channel list response
+    e.g. "AI 1/1","AI 1/2" or NONE
+    """
+    channel_names = [ch_name.decode() for ch_name in _QUOTED_RE.findall(ret)]
+    if len(channel_names) == 1:
+        log.debug('One Channel Set: {:s}'.format(channel_names[0]))
+    if len(channel_names) == 0:
+        log.warning('No Channel Set')
+    return channel_names
+
+def _format_channel_list(channel_names):
+    """
+    Quoted channel list of a command, e.g. "AI 1/1","AI 1/2"
+    """
+    return '"{:s}"'.format('","'.join(channel_names))
+
+class _OxygenSCPIBase:
+    """
+    Connection parameters, protocol state and response parsing shared by
+    OxygenSCPI and AsyncOxygenSCPI, without any I/O
+    """
+    def __init__(self, ip_addr, tcp_port = 10001, timeout = 5, tcp_nodelay = True,
+                 block_size = 1024*1024):
         self._ip_addr = ip_addr
         self._tcp_port = tcp_port
         self._CONN_NUM_TRY = 3
         self._CONN_TIMEOUT = timeout
-        self._CONN_MSG_DELAY = 0.05
-        self._TCP_BLOCK_SIZE = 4096
-        self._sock = None
-        #self.connect()
+        # Read buffer size, large responses (e.g. ELOG fetches) are read
+        # with few system calls
+        self._TCP_BLOCK_SIZE = block_size
+        self._TCP_SOCK_BUF_SIZE = 1024*1024
+        self._TCP_NODELAY = tcp_nodelay
         self._headersActive = True
         self.channelList = []
-        self._scpi_version = (1,5)
+        self._setVersion((1,5))
         self._value_dimension = None
-        self._value_format = self.NumberFormat.ASCII
+        self._timestamp_columns = frozenset()
+        self._value_slice_plan = None
+        self._channel_cmd_key = None
+        self._channel_cmd = None
+        self._value_byteorder = '<'
         self.elogChannelList = []
+
+    @staticmethod
+    def _transferChannelNames(channelNames, includeRelTime, includeAbsTime):
+        """ Transfer channel list including the requested timestamp channels
+        """
+        prefix = []
+        if includeAbsTime:
+            prefix.append("ABS-TIME")
+        if includeRelTime:
+            prefix.append("REL-TIME")
+        # Copy, the caller's list must not be modified
+        return prefix + list(channelNames)
+
+    def _configureSocket(self, sock):
+        """ Disable Nagle's algorithm (unless opted out), enlarge the socket
+        buffers and enable keepalive probes
+        """
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1 if self._TCP_NODELAY else 0)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self._TCP_SOCK_BUF_SIZE)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self._TCP_SOCK_BUF_SIZE)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        for option, value in _KEEPALIVE_OPTIONS:
+            sock.setsockopt(socket.IPPROTO_TCP, option, value)
+
+    @staticmethod
+    def _encodeCmd(cmd):
+        """ LF terminated bytes of a str command, bytes are passed as they are
+        """
+        if isinstance(cmd, str):
+            return (cmd + '\n').encode()
+        return cmd
+
+    def _parseVersion(self, ret):
+        if isinstance(ret, bytes):
+            match = _VER_RE.search(ret)
+            if match:
+                self._setVersion((int(match.group(1)), int(match.group(2))))
+                return self._scpi_version
+        return None
+
+    def _setVersion(self, version):
+        """ Store the protocol version and the features depending on it
+        """
+        self._scpi_version = version = tuple(version)
+        self._has_v1_6 = version >= (1,6)
+        self._has_v1_7 = version >= (1,7)
+        self._has_v1_20 = version >= (1,20)
+
+    def _transferChannelsCmds(self, channelNames):
+        """ Commands to set the transfer channels and their number
+        """
+        key = tuple(channelNames)
+        if key != self._channel_cmd_key:
+            channelListStr = _format_channel_list(channelNames)
+            self._channel_cmd = (':NUM:NORMAL:ITEMS {:s}\n'.format(channelListStr)).encode()
+            self._channel_cmd_key = key
+        return [self._channel_cmd, _TPL_NUM_NUMBER % len(channelNames)]
+
+    def _parseTransferChannels(self, ret, numRequested):
+        """ Evaluate the read back transfer channels
+
+        Returns False if the number of channels differs from the requested one
+        """
+        channelNames = _parse_channel_list(ret)
+        self._setTransferChannelList(channelNames)
+        return len(channelNames) == numRequested
+
+    def _setTransferChannelList(self, channelNames):
+        """ Take over the transfered channels and their value layout
+        """
+        self.channelList = channelNames
+        self._updateValueLayout()
+        if self._has_v1_6:
+            # Dimensions are queried on the next getValues
+            self._value_dimension = _DIMS_DIRTY
+
+    def _updateValueLayout(self):
+        """ Determine the value positions of the transfered channels
+
+        Values of timestamp channels are parsed as datetime, all others as
+        float. The slice plan maps the flat value list to scalar and array
+        values per channel, it is only needed if there are array channels.
+        """
+        dims = self._value_dimension
+        has_dims = isinstance(dims, list)
+        if not has_dims:
+            dims = [1] * len(self.channelList)
+        columns = set()
+        plan = []
+        idx = 0
+        for pos, dim in enumerate(dims):
+            if pos < len(self.channelList) and self.channelList[pos] == 'ABS-TIME':
+                columns.add(idx)
+            if dim <= 1:
+                plan.append((True, idx, idx+1))
+                idx += 1
+            else:
+                plan.append((False, idx, idx+dim))
+                idx += dim
+        self._timestamp_columns = frozenset(columns)
+        # Without array channels the flat value list is already the result
+        self._value_slice_plan = plan if has_dims and idx != len(dims) else None
+
+    def _parseValueDimensions(self, ret):
+        if isinstance(ret, bytes):
+            # Remove Header if present, int() accepts bytes and surrounding whitespace
+            dim = ret.rpartition(b' ')[2].split(b',')
+            try:
+                self._value_dimension = [int(d) for d in dim]
+            except (TypeError, ValueError):
+                self._value_dimension = False
+                return False
+            self._updateValueLayout()
+            return True
+        return False
+
+    def _get_value_from_binary(self, data):
+        """ Convert binary float32 values to float values array
+        """
+        numlenchars = int(chr(data[1]))
+        array_length = int(data[2:(2+numlenchars)])
+        num_values = array_length // 4
+        data = memoryview(data)[(2 + numlenchars):(2 + numlenchars + num_values * 4)]
+
+        byteorder = self._value_byteorder
+        if np is not None:
+            return np.frombuffer(data, dtype=byteorder + 'f4').tolist()
+        return list(_float32_struct(byteorder, num_values).unpack(data))
+
+    def _get_value_from_ascii(self, data):
+        """ Convert ASCII values to array
+        """
+        # Plain float conversion is faster than NumPy's text parsing plus
+        # the conversion of the array back to a list
+        return self._parse_ascii_tokens(data.split(b','))
+
+    def _parse_ascii_tokens(self, data):
+        """ Convert ASCII value tokens, starting at the first value
+        """
+        # Timestamps are only parsed at their known positions, the remaining
+        # tokens are converted without a check per token
+        timestamps = [(idx, data[idx]) for idx in self._timestamp_columns if idx < len(data)]
+        if timestamps:
+            data = list(data)
+            for idx, _ in timestamps:
+                data[idx] = b'0'
+        try:
+            values = list(map(float, data))
+        except ValueError:
+            # Text or timestamps of unknown channels
+            values = list(map(_parse_value_token, data))
+        for idx, val in timestamps:
+            values[idx] = _parse_text_token(val)
+        return values
+
+    def _parseValues(self, data):
+        if not isinstance(data, bytes):
+            # No Data Available or Wrong Channel
+            return False
+
+        # Remove Header if Whitespace present
+        if data.startswith(b':NUM:VAL '):
+            data = data[9:]
+        
+        # Remove trailing newline
+        if len(data) > 1 and data[-1] == ord('\n'):
+            data = data[0:-1]
+
+        # Check if we have binary data (e.g. #18abcdefgh)
+        if len(data) > 2 and data[0] == ord('#'):
+            data = self._get_value_from_binary(data)
+        else:
+            data = self._get_value_from_ascii(data)
+        
+        plan = self._value_slice_plan
+        if plan is not None:
+            # Scalar or array value per channel
+            return [data[start] if is_scalar else data[start:stop]
+                    for is_scalar, start, stop in plan]
+        
+        return data
+
+    def _parseElogChannels(self, ret):
+        if isinstance(ret, bytes):
+            channel_names = _parse_channel_list(ret)
+            self.elogChannelList = channel_names
+            if len(channel_names) == 0:
+                return False
+            return True
+        return False
+
+    def _parseElog(self, data, as_ndarray=False):
+        if not isinstance(data, bytes):
+            return False
+        if b'NONE' in data:
+            return False
+        # Remove Header if Whitespace present
+        if b' ' in data:
+            data = data.partition(b' ')[2]
+        data = data.rstrip()
+        num_ch = len(self.elogChannelList)+1
+        if as_ndarray and b'"' not in data:
+            values = _parse_numeric(data)
+            if values is not None:
+                num_items = len(values) // num_ch
+                return values[:num_items*num_ch].reshape(num_items, num_ch)
+        data = data.decode().split(',')
+        if as_ndarray:
+            num_items = len(data) // num_ch
+            return np.asarray(data[:num_items*num_ch], dtype=object).reshape(num_items, num_ch)
+        # Chunk into rows in C, an incomplete last row is dropped
+        return list(map(list, zip(*[iter(data)] * num_ch)))
+
+class OxygenSCPI(_OxygenSCPIBase):
+    """
+    Oxygen SCPI control class
+    """
+    def __init__(self, ip_addr, tcp_port = 10001, timeout = 5, tcp_nodelay = True,
+                 block_size = 1024*1024):
+        super().__init__(ip_addr, tcp_port, timeout, tcp_nodelay, block_size)
+        # Queries waiting for late responses before reconnecting
+        self._STALE_NUM_WAIT = 3
+        self._sock = None
+        # Received bytes which are not yet returned as response
+        self._rbuf = bytearray()
+        self._recv_buf = memoryview(bytearray(min(self._TCP_BLOCK_SIZE, _RECV_SIZE_MAX)))
+        self._stale_responses = 0
+        self._stale_waits = 0
+        self._batch = None
+        #self.connect()
+        self._value_format = self.NumberFormat.ASCII
+        self._lock = threading.RLock()
+        self._elog_thread = None
+        self._elog_stop = threading.Event()
+        self._elog_queue = None
         self.DataStream = OxygenScpiDataStream(self)
         self.ChannelProperties = OxygenChannelProperties(self)
 
     def connect(self):
         for numTry in range(1, self._CONN_NUM_TRY+1):
             sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 0)
+            self._configureSocket(sock)
             # sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, 0)
             sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
             sock.settimeout(self._CONN_TIMEOUT)
             try:
                 sock.connect((self._ip_addr, self._tcp_port))
-                self._sock = sock
-                self.headersOff()
-                self.getVersion()
+                self._attachSocket(sock)
                 return True
             except ConnectionRefusedError as msg:
                 template = "Connection to {!s}:{:d} refused: {!s}"
@@ -73,7 +507,39 @@ class OxygenSCPI:
                 return False
         self._sock = sock
 
+    @classmethod
+    def fromSocket(cls, sock, timeout = 5, **kwargs):
+        """Creates an instance using an already connected socket
+
+        Allows higher level code to reuse connections. The peer address
+        is kept for reconnecting.
+
+        Args:
+            sock (socket.socket): Connected TCP socket
+            timeout (float): Response timeout in seconds
+            kwargs: Further constructor arguments
+        """
+        ip_addr, tcp_port = sock.getpeername()[:2]
+        oxygen = cls(ip_addr, tcp_port, timeout, **kwargs)
+        oxygen._configureSocket(sock)
+        sock.settimeout(timeout)
+        oxygen._attachSocket(sock)
+        return oxygen
+
+    def _attachSocket(self, sock):
+        """ Use a connected socket and initialize the session
+        """
+        self._sock = sock
+        self._rbuf.clear()
+        # The setup may have changed while disconnected
+        self.ChannelProperties.invalidate()
+        self.headersOff()
+        self.getVersion()
+
     def disconnect(self):
+        self._rbuf.clear()
+        self._stale_responses = 0
+        self._stale_waits = 0
         try:
             self._sock.shutdown(socket.SHUT_RDWR)
             self._sock.close()
@@ -83,43 +549,221 @@ class OxygenSCPI:
             log.error("Error Shutting Down: %s", msg)
         self._sock = None
 
-    def _sendRaw(self, cmd):
-        cmd += '\n'
-        if self._sock is None:
-            self.connect()
+    def _checkConnection(self):
+        """ Connect if required and make sure the socket has no pending error
+        """
         if self._sock is not None:
             try:
-                self._sock.sendall(cmd.encode())
-                sleep(self._CONN_MSG_DELAY)
-                return True
+                err = self._sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
             except OSError as msg:
+                err = msg.errno
+            if err:
+                log.warning("Socket error, reconnecting: %s", os.strerror(err))
                 self.disconnect()
-                template = "{!s}"
-                log.error(template.format(msg))
-        return False
-
-    def _askRaw(self, cmd):
-        cmd += '\n'
         if self._sock is None:
             self.connect()
-        if self._sock is not None:
+        return self._sock is not None
+
+    def _handleSocketError(self, msg):
+        """ Log the error and disconnect, the next command reconnects
+
+        EINTR is retried by Python itself and a timeout surfaces as
+        socket.timeout. After a timeout part of the command may have been
+        sent, so the connection cannot be used any further either.
+        """
+        if isinstance(msg, socket.timeout):
+            log.error("Timeout sending to %s: %s", self._ip_addr, msg)
+        else:
+            template = "{!s}"
+            log.error(template.format(msg))
+        self.disconnect()
+
+    def _sendRaw(self, cmd):
+        """ Send a command to the device
+
+        cmd is either a str or pre-encoded, LF terminated bytes
+        """
+        cmd = self._encodeCmd(cmd)
+        with self._lock:
+            if self._batch is not None:
+                self._batch.append(cmd)
+                return True
+            if self._checkConnection():
+                try:
+                    self._sock.sendall(cmd)
+                    return True
+                except OSError as msg:
+                    self._handleSocketError(msg)
+            return False
+
+    def _sendBatch(self, cmds):
+        """ Send several commands with a single write
+
+        cmds is a list of str or pre-encoded, LF terminated bytes
+        """
+        return self._sendRaw(b''.join(map(self._encodeCmd, cmds)))
+
+    @contextmanager
+    def batch(self):
+        """Collects the commands of a block and sends them with a single write
+
+        Usage:
+            with device.batch():
+                device.setRate(100)
+                device.setElogPeriod(0.1)
+
+        A query within the block sends the collected commands first. If the
+        block raises, the commands collected so far are dropped.
+        """
+        with self._lock:
+            if self._batch is not None:
+                # Nested block, the outer block sends the commands
+                yield
+                return
+            self._batch = []
             try:
-                self._sock.sendall(cmd.encode())
-                answerMsg = bytes(0)
-                while True:
-                    data = self._sock.recv(self._TCP_BLOCK_SIZE)
-                    answerMsg += data
-                    if data[-1:] == b'\n':
-                        return answerMsg
-            except OSError as msg:
-                self.disconnect()
-                template = "{!s}"
-                log.error(template.format(msg))
-        return False
+                yield
+            except BaseException:
+                self._batch = None
+                raise
+            cmds, self._batch = self._batch, None
+            if cmds:
+                self._sendBatch(cmds)
+
+    def _sendAndWait(self, cmd):
+        """ Send a command and wait until the device has completed it
+
+        The command is sent together with *OPC? in a single write.
+        """
+        ret = self._askRaw(self._encodeCmd(cmd) + _CMD_OPC)
+        return isinstance(ret, bytes) and ret.strip().endswith(b'1')
+
+    def _askRaw(self, cmd):
+        """ Send a query to the device and return the response
+
+        cmd is either a str or pre-encoded, LF terminated bytes. It may
+        contain several commands as long as only one response is returned.
+        """
+        ret = self._query([self._encodeCmd(cmd)], 1)
+        return ret[0] if ret else False
+
+    def _askMany(self, cmds):
+        """ Send several commands and queries with a single write
+
+        cmds is a list of str or pre-encoded, LF terminated bytes and must
+        contain at least one query. Returns the list of query responses in
+        order or False on error.
+        """
+        cmds = [self._encodeCmd(cmd) for cmd in cmds]
+        num_queries = sum(1 for cmd in cmds if cmd.split(b' ', 1)[0].rstrip().endswith(b'?'))
+        return self._query(cmds, num_queries)
+
+    def _query(self, parts, num_responses):
+        """ Send the encoded commands and read the given number of responses
+
+        Returns the list of responses or False on error
+        """
+        with self._lock:
+            if self._batch:
+                # Send collected commands together with the queries
+                parts = self._batch + parts
+                self._batch.clear()
+            if self._checkConnection():
+                try:
+                    if not self._discardStaleResponses():
+                        # A slow device is no reason to reconnect
+                        return False
+                    self._sendParts(parts)
+                    responses = []
+                    for idx in range(num_responses):
+                        ret = self._readResponse(self._CONN_TIMEOUT)
+                        if ret is None:
+                            # Keep the connection, the late responses are
+                            # discarded before the next query
+                            log.warning("No response within %s s", self._CONN_TIMEOUT)
+                            self._stale_responses += num_responses - idx
+                            return False
+                        responses.append(ret)
+                    return responses
+                except OSError as msg:
+                    self._handleSocketError(msg)
+            return False
+
+    def _sendParts(self, parts):
+        """ Send a list of bytes with a single gathering write if possible
+        """
+        if len(parts) == 1 or len(parts) > _MAX_SEND_PARTS or not _HAS_SENDMSG:
+            self._sock.sendall(b''.join(parts))
+            return
+        parts = list(parts)
+        while parts:
+            sent = self._sock.sendmsg(parts)
+            # Continue after a partial write
+            while parts and sent >= len(parts[0]):
+                sent -= len(parts[0])
+                parts = parts[1:]
+            if sent:
+                parts[0] = memoryview(parts[0])[sent:]
+
+    def _discardStaleResponses(self):
+        """ Read and drop the late responses of timed out queries
+
+        Returns False if the device is still busy with these queries. If the
+        responses are still missing after several queries, the connection is
+        closed and the next command reconnects.
+        """
+        while self._stale_responses > 0:
+            if self._readResponse(self._CONN_TIMEOUT) is None:
+                self._stale_waits += 1
+                if self._stale_waits >= self._STALE_NUM_WAIT:
+                    log.error("%d late response(s) missing, reconnecting", self._stale_responses)
+                    self.disconnect()
+                else:
+                    log.warning("Still waiting for %d late response(s)", self._stale_responses)
+                return False
+            self._stale_responses -= 1
+        self._stale_waits = 0
+        return True
+
+    def _readResponse(self, timeout):
+        """ Read one LF terminated response from the device
+
+        Definite length blocks (e.g. #18abcdefgh) may contain LF characters
+        within their payload, so these are read according to their length.
+        Several responses may arrive at once, so the socket is only waited
+        for if the receive buffer holds no complete response.
+        Returns None on timeout, partially received data is kept.
+        """
+        buf = self._rbuf
+        deadline = monotonic() + timeout
+        scanned = 0
+        length = 0
+        while True:
+            if not length:
+                end = buf.find(b'\n', scanned)
+                if end >= 0:
+                    # The block header is at the start, the line is not copied
+                    head = buf[:min(end + 1, _BLOCK_HEAD_SIZE)]
+                    length = max(end + 1, _block_length(head))
+                else:
+                    scanned = len(buf)
+            if length and len(buf) >= length:
+                with memoryview(buf) as view:
+                    answerMsg = view[:length].tobytes()
+                del buf[:length]
+                return answerMsg
+            remaining = deadline - monotonic()
+            if remaining <= 0 or not select.select([self._sock], [], [], remaining)[0]:
+                return None
+            # Received into a buffer allocated once, not a new object per call
+            num_bytes = self._sock.recv_into(self._recv_buf)
+            if not num_bytes:
+                raise ConnectionResetError("Connection closed by peer")
+            buf += self._recv_buf[:num_bytes]
 
     def getIdn(self):
-        ret = self._askRaw('*IDN?')
-        if type(ret) == bytes:
+        ret = self._askRaw(_CMD_IDN)
+        if isinstance(ret, bytes):
             return ret.decode().strip()
         return False
 
@@ -127,25 +771,21 @@ class OxygenSCPI:
         """
         SCPI,"1999.0",RC_SCPI,"1.6",OXYGEN,"2.5.71"
         """
-        ret = self._askRaw('*VER?')
-        if type(ret) == bytes:
-            ret = ret.decode().strip().split(',')
-            self._scpi_version = ret[3].replace('"','').split('.')
-            self._scpi_version = (int(self._scpi_version[0]), int(self._scpi_version[1]))
-            return self._scpi_version
-        return None
+        ret = self._askRaw(_CMD_VER)
+        return self._parseVersion(ret)
 
     def reset(self):
-        self._sendRaw('*RST')
+        self.ChannelProperties.invalidate()
+        self._sendRaw(_CMD_RST)
 
     def headersOff(self):
         """
         Deactivate Headers on response
         """
-        self._sendRaw(':COMM:HEAD OFF')
         self._headersActive = False
+        return self._sendRaw(_CMD_HEADERS_OFF)
 
-    def setRate(self, rate=500):
+    def setRate(self, rate=500, wait=False):
         """Sets the Aggregation Rate of the measurement device
 
         This Function sets the aggregation rate (mean value) to the
@@ -153,11 +793,15 @@ class OxygenSCPI:
 
         Args:
             rate (int): interval in milliseconds
+            wait (bool): Wait until the device has applied the rate (*OPC?)
 
         Returns:
             Nothing
         """
-        return self._sendRaw(':RATE {:d}ms'.format(rate))
+        cmd = _TPL_RATE % rate
+        if wait:
+            return self._sendAndWait(cmd)
+        return self._sendRaw(cmd)
 
     def loadSetup(self, setup_name):
         """Loads the specified setup on the measurement device
@@ -171,9 +815,11 @@ class OxygenSCPI:
         Returns:
             Nothing
         """
+        # Channel IDs may refer to other channels after loading
+        self.ChannelProperties.invalidate()
         return self._sendRaw(':SETUP:LOAD "{:s}"'.format(setup_name))
 
-    def setTransferChannels(self, channelNames, includeRelTime=False, includeAbsTime=False):
+    def setTransferChannels(self, channelNames, includeRelTime=False, includeAbsTime=False, verify=True):
         """Sets the channels to be transfered within the numeric system
 
         This Function sets the channels to be transfered. This list must
@@ -181,41 +827,39 @@ class OxygenSCPI:
 
         Args:
             channelNames (list of str): List of channel names
+            verify (bool): Read back the channels accepted by the device.
+                Without verification the names are trusted, which saves
+                a round-trip.
 
         Returns:
             True if Suceeded, False if not
         """
-        if includeRelTime:
-            channelNames.insert(0, "REL-TIME")
-        if includeAbsTime:
-            channelNames.insert(0, "ABS-TIME")
-        channelListStr = '"'+'","'.join(channelNames)+'"'
-        ret = self._sendRaw(':NUM:NORMAL:ITEMS {:s}'.format(channelListStr))
-        # Read back actual set channel names
-        ret = self._askRaw(':NUM:NORMAL:ITEMS?')
-        if isinstance(ret, bytes):
-            ret = ret.decode().strip()
-            ret = ret.replace(':NUM:ITEMS ','')
-            channelNames = ret.split('","')
-            channelNames = [chName.replace('"','') for chName in channelNames]
-            if len(channelNames) == 1:
-                log.debug('One Channel Set: {:s}'.format(channelNames[0]))
-                if channelNames[0] == 'NONE':
-                    channelNames = []
-                    log.warning('No Channel Set')
-            self.channelList = channelNames
-            ret = self.setNumberChannels()
-            if not ret:
-                return False
-            if is_minimum_version(self._scpi_version, (1,6)):
-                return self.getValueDimensions()
-            return True
-        return False
+        channelNames = self._transferChannelNames(channelNames, includeRelTime, includeAbsTime)
+        cmd_items, cmd_number = self._transferChannelsCmds(channelNames)
+        if not verify:
+            ret = self._sendBatch([cmd_items, cmd_number])
+            if ret:
+                self._setTransferChannelList(channelNames)
+            return ret
+        # Read back actual set channel names and their dimensions
+        # within the same write
+        cmds = [cmd_items, ':NUM:NORMAL:ITEMS?', cmd_number]
+        if self._has_v1_6:
+            cmds.append(':NUM:NORM:DIMS?')
+        ret = self._askMany(cmds)
+        if not ret:
+            return False
+        if not self._parseTransferChannels(ret[0], len(channelNames)):
+            # Some channels were not accepted, correct the number
+            return bool(self.setNumberChannels())
+        if self._has_v1_6:
+            self._parseValueDimensions(ret[1])
+        return True
 
     def setNumberChannels(self, number=None):
         if number is None:
             number = len(self.channelList)
-        return self._sendRaw(':NUM:NORMAL:NUMBER {:d}'.format(number))
+        return self._sendRaw(_TPL_NUM_NUMBER % number)
 
     class NumberFormat(Enum):
         ASCII = 0
@@ -227,7 +871,7 @@ class OxygenSCPI:
         Set the number format of the output
         Available since 1.20
         """
-        if not is_minimum_version(self._scpi_version, (1,20)):
+        if not self._has_v1_20:
             raise NotImplementedError(":NUM:NORMAL:FORMAT requires protocol version 1.20");
 
         if format == self.NumberFormat.BINARY_INTEL:
@@ -237,27 +881,40 @@ class OxygenSCPI:
         else:
             fmt = "ASCII"
 
-        self._sendRaw(':NUM:NORMAL:FORMAT {:s}'.format(fmt))
         self._value_format = format # Cache value
+        self._value_byteorder = '>' if format == self.NumberFormat.BINARY_MOTOROLA else '<'
+        return self._sendRaw(':NUM:NORMAL:FORMAT {:s}'.format(fmt))
+
+    def enableBinaryValues(self):
+        """
+        Switch the value transfer to binary (little endian float32) if possible
+
+        Binary values are decoded without parsing text, but are only single
+        precision. Absolute timestamps cannot be transfered binary, call this
+        after setTransferChannels.
+        Returns True if switched
+        """
+        if not self._has_v1_20 or self._timestamp_columns:
+            return False
+        return self.setNumberFormat(self.NumberFormat.BINARY_INTEL)
 
     def getNumberFormat(self) -> NumberFormat:
         """
         Read the number format of the output
         Available since 1.20
         """
-        if not is_minimum_version(self._scpi_version, (1,20)):
+        if not self._has_v1_20:
             raise NotImplementedError(":NUM:NORMAL:FORMAT? requires protocol version 1.20");
 
         ret = self._askRaw(':NUM:NORM:FORMAT?')
         if isinstance(ret, bytes):
-            format = ret.decode()
-            if ' ' in format:
-                format = format.split(' ')[1].rstrip()
-            if format == "ASCII":
+            # Remove Header if present
+            format = ret.rpartition(b' ')[2].strip()
+            if format == b"ASCII":
                 return self.NumberFormat.ASCII
-            elif format == "BIN_INTEL":
+            elif format == b"BIN_INTEL":
                 return self.NumberFormat.BINARY_INTEL
-            elif format == "BIN_MOTOROLA":
+            elif format == b"BIN_MOTOROLA":
                 return self.NumberFormat.BINARY_MOTOROLA
         raise Exception("Invalid NumberFormat")
 
@@ -266,59 +923,16 @@ class OxygenSCPI:
         Available since 1.6
         """
         ret = self._askRaw(':NUM:NORM:DIMS?')
-        if isinstance(ret, bytes):
-            dim = ret.decode()
-            if ' ' in dim:
-                dim = dim.split(' ')[1]
-            dim = dim.split(',')
-            try:
-                self._value_dimension = [int(d) for d in dim]
-            except TypeError:
-                self._value_dimension = False
-                return False
-            return True
-        return False
+        return self._parseValueDimensions(ret)
 
     def setValueMaxDimensions(self):
         if self.getValueDimensions():
-            for idx in range(len(self._value_dimension)):
-                self._sendRaw(':NUM:NORMAL:DIM{:d} MAX'.format(idx+1))
+            self._sendBatch([_TPL_NUM_DIM_MAX % (idx+1)
+                             for idx in range(len(self._value_dimension))])
         else:
             return False
         return self.getValueDimensions()
 
-    def _get_value_from_binary(self, data):
-        """ Convert binary float32 values to float values array
-        """
-        numlenchars = int(chr(data[1]))
-        array_length = int(data[2:(2+numlenchars)])
-        data = data[(2 + numlenchars):(2 + numlenchars + array_length)]
-
-        is_intel = self._value_format != self.NumberFormat.BINARY_MOTOROLA
-        byteorder = "<" if is_intel else ">"
-        return list(unpack(byteorder + "f" * (int(len(data)/4)), data))
-
-    def _get_value_from_ascii(self, data):
-        """ Convert ASCII values to array
-        """
-        data = data.decode().split(',')
-        values = []
-        for val in data:
-            try:
-                values.append(float(val))
-                continue
-            except ValueError:
-                pass
-            try:
-                # Try to Parse DateTime "2017-10-10T12:16:52.33136+02:00"
-                # Variable lenght of Sub-Seconds
-                iso_ts = ''.join(val.replace('"','').rsplit(':', 1))
-                timestamp = dt.datetime.strptime(iso_ts, '%Y-%m-%dT%H:%M:%S.%f%z')
-                values.append(timestamp)
-            except ValueError:
-                values.append(val)
-        return values
-
     def getValues(self):
         """Queries the actual values from the numeric system
 
@@ -330,44 +944,14 @@ class OxygenSCPI:
         Returns:
             List of values (list)
         """
-        try:
-            data = self._askRaw(':NUM:NORM:VAL?')
-        except OSError:
+        if self._value_dimension is _DIMS_DIRTY and not self.getValueDimensions():
             return False
 
-        if not type(data) is bytes:
-            # No Data Available or Wrong Channel
+        try:
+            data = self._askRaw(_CMD_GET_VALUES)
+        except OSError:
             return False
-
-        # Remove Header if Whitespace present
-        if data.startswith(b':NUM:VAL '):
-            data = data[9:]
-        
-        # Remove trailing newline
-        if len(data) > 1 and data[-1] == ord('\n'):
-            data = data[0:-1]
-
-        # Check if we have binary data (e.g. #18abcdefgh)
-        if len(data) > 2 and data[0] == ord('#'):
-            data = self._get_value_from_binary(data)
-        else:
-            data = self._get_value_from_ascii(data)
-        
-        if self._value_dimension is not None:
-            idx = 0
-            values = []
-            for dim in self._value_dimension:
-                if dim <= 1:
-                    # Add scalar value
-                    values.append(data[idx])
-                    idx += 1
-                else:
-                    # Add array value
-                    values.append(data[idx:idx+dim])
-                    idx += dim
-            return values
-        
-        return data
+        return self._parseValues(data)
 
     def storeSetFileName(self, file_name):
         """Sets the file name for the subsequent storing (recording) action
@@ -385,19 +969,26 @@ class OxygenSCPI:
         except OSError:
             return False
 
-    def storeStart(self):
+    def storeStart(self, file_name=None, wait=False):
         """Starts the storing (recording) action or resumes if it was paused.
 
         This Function starts the storing action or resumes if it was paused
         The data will be stored in the file previous set with setStoreFileName.
+        If a file name is given, it is set together with the start command.
 
         Args:
-            None
+            File Name (str, optional)
+            wait (bool): Wait until the device has started storing (*OPC?)
         Returns:
             Status (bool)
         """
         try:
-            return self._sendRaw(':STOR:START')
+            cmds = [_CMD_STOR_START]
+            if file_name is not None:
+                cmds.insert(0, ':STOR:FILE:NAME "{:s}"'.format(file_name))
+            if wait:
+                return self._sendAndWait(b''.join(map(self._encodeCmd, cmds)))
+            return self._sendBatch(cmds)
         except OSError:
             return False
 
@@ -412,7 +1003,7 @@ class OxygenSCPI:
             Status (bool)
         """
         try:
-            return self._sendRaw(':STOR:PAUSE')
+            return self._sendRaw(_CMD_STOR_PAUSE)
         except OSError:
             return False
 
@@ -428,10 +1019,48 @@ class OxygenSCPI:
             Status (bool)
         """
         try:
-            return self._sendRaw(':STOR:STOP')
+            return self._sendRaw(_CMD_STOR_STOP)
         except OSError:
             return False
 
+    def getStoreState(self):
+        """Queries the state of the storing (recording) action.
+
+        Args:
+            None
+        Returns:
+            State (str), e.g. "Recording" or "Stopped"
+        """
+        ret = self._askRaw(_CMD_STOR_STATE)
+        if isinstance(ret, bytes):
+            return _strip_header(ret).decode()
+        return False
+
+    def storeWait(self, max_seconds, poll_interval=0.1):
+        """Waits until the storing (recording) action has stopped.
+
+        This Function polls the storing state and returns as soon as it has
+        stopped, but at the latest after max_seconds. In between the socket
+        is watched, so a closed connection ends the wait immediately.
+
+        Args:
+            max_seconds (float): Maximum time to wait in seconds
+            poll_interval (float): Time between state queries in seconds
+        Returns:
+            True if storing has stopped, False on timeout or error
+        """
+        deadline = monotonic() + max_seconds
+        while True:
+            state = self.getStoreState()
+            if state is False:
+                return False
+            if state.lower() == 'stopped':
+                return True
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                return False
+            select.select([self._sock], [], [], min(poll_interval, remaining))
+
     def getErrorSingle(self):
         """Query the first item in the error queue.
 
@@ -460,19 +1089,19 @@ class OxygenSCPI:
 
     def startAcquisition(self):
         try:
-            return self._sendRaw(':ACQU:START')
+            return self._sendRaw(_CMD_ACQU_START)
         except OSError:
             return False
 
     def stopAcquisition(self):
         try:
-            return self._sendRaw(':ACQU:STOP')
+            return self._sendRaw(_CMD_ACQU_STOP)
         except OSError:
             return False
 
     def restartAcquisition(self):
         try:
-            return self._sendRaw(':ACQU:RESTART')
+            return self._sendRaw(_CMD_ACQU_RESTART)
         except OSError:
             return False
 
@@ -482,12 +1111,11 @@ class OxygenSCPI:
         WAITING_FOR_SYNC = "Waiting_for_sync"
 
     def getAcquisitionState(self):
-        ret = self._askRaw(':ACQU:STAT?')
+        ret = self._askRaw(_CMD_ACQU_STATE)
         if isinstance(ret, bytes):
-            state = ret.decode().strip()
-            return self.AcquisitionState(state)
+            return self.AcquisitionState(_strip_header(ret).decode())
 
-    def setElogChannels(self, channel_names):
+    def setElogChannels(self, channel_names, verify=True):
         """Sets the channels to be transfered within the ELOG system
 
         This Function sets the channels to be transfered. This list must
@@ -495,43 +1123,32 @@ class OxygenSCPI:
 
         Args:
             channelNames (list of str): List of channel names
+            verify (bool): Read back the channels accepted by the device
 
         Returns:
             True if Suceeded, False if not
         """
-        if not is_minimum_version(self._scpi_version, (1,7)):
+        if not self._has_v1_7:
             log.warning('SCPI Version 1.7 or higher required')
             return False
 
-        channel_list_str = '"'+'","'.join(channel_names)+'"'
-        ret = self._sendRaw(':ELOG:ITEMS {:s}'.format(channel_list_str))
-        sleep(0.1)
+        channel_list_str = _format_channel_list(channel_names)
+        ret = self._sendAndWait(':ELOG:ITEMS {:s}'.format(channel_list_str))
+        if not verify:
+            self.elogChannelList = list(channel_names)
+            return ret and len(channel_names) > 0
         # Read back actual set channel names
         ret = self._askRaw(':ELOG:ITEMS?')
-        if isinstance(ret, bytes):
-            ret = ret.decode().strip()
-            ret = ret.replace(':ELOG:ITEM ','')
-            channel_names = ret.split('","')
-            channel_names = [ch_name.replace('"','') for ch_name in channel_names]
-            if len(channel_names) == 1:
-                log.debug('One Channel Set: {:s}'.format(channel_names[0]))
-                if channel_names[0] == 'NONE':
-                    channel_names = []
-                    log.warning('No Channel Set')
-            self.elogChannelList = channel_names
-            if len(channel_names) == 0:
-                return False
-            return True
-        return False
+        return self._parseElogChannels(ret)
 
     def startElog(self):
-        return self._sendRaw(':ELOG:START')
+        return self._sendRaw(_CMD_ELOG_START)
 
     def setElogPeriod(self, period):
-        return self._sendRaw(':ELOG:PERIOD {:f}'.format(period))
+        return self._sendRaw(_TPL_ELOG_PERIOD % period)
 
     def stopElog(self):
-        return self._sendRaw(':ELOG:STOP')
+        return self._sendRaw(_CMD_ELOG_STOP)
 
     def setElogTimestamp(self, tsType='REL'):
         if tsType == 'REL':
@@ -540,23 +1157,95 @@ class OxygenSCPI:
             return self._sendRaw(':ELOG:TIM ABS')
         return self._sendRaw(':ELOG:TIM OFF')
 
-    def fetchElog(self):
-        data = self._askRaw(':ELOG:FETCH?')
-        if type(data) is bytes:
-            data = data.decode()
-        else:
+    def fetchElog(self, as_ndarray=False):
+        """Fetches the values logged by the ELOG system since the last fetch
+
+        Each row contains the timestamp followed by the values of the
+        channels defined in setElogChannels.
+
+        Args:
+            as_ndarray (bool): Return a 2-D NumPy array instead of a list of
+                rows (requires NumPy). Numeric data is returned as float array,
+                data with absolute timestamps as object array of str.
+        Returns:
+            List of rows (list of list of str) or numpy.ndarray,
+            False if no data is available
+        """
+        if as_ndarray and np is None:
+            raise NotImplementedError("fetchElog(as_ndarray=True) requires NumPy")
+        data = self._askRaw(_CMD_ELOG_FETCH)
+        return self._parseElog(data, as_ndarray)
+
+    def startElogStreaming(self, poll_interval=0.1, as_ndarray=False, max_batches=1000):
+        """Starts fetching ELOG data continuously in a background thread
+
+        The fetched batches are queued and can be consumed with popElogBatch,
+        so the caller does not have to wait for the fetch round-trip.
+
+        Args:
+            poll_interval (float): Wait time in seconds if no data is available
+            as_ndarray (bool): Queue batches as NumPy arrays (see fetchElog)
+            max_batches (int): Maximum number of queued batches. Fetching
+                pauses while the queue is full.
+        Returns:
+            True if started, False if already running
+        """
+        if as_ndarray and np is None:
+            raise NotImplementedError("startElogStreaming(as_ndarray=True) requires NumPy")
+        if self._elog_thread is not None:
             return False
-        if 'NONE' in data:
+        self._elog_queue = queue.Queue(maxsize=max_batches)
+        self._elog_stop.clear()
+        self._elog_thread = threading.Thread(
+            target=self._elogReaderLoop, args=(poll_interval, as_ndarray),
+            name='oxygenscpi-elog', daemon=True)
+        self._elog_thread.start()
+        return True
+
+    def stopElogStreaming(self):
+        """Stops the background ELOG fetching started by startElogStreaming
+
+        Batches that are already queued can still be consumed.
+        """
+        if self._elog_thread is None:
+            return
+        self._elog_stop.set()
+        self._elog_thread.join()
+        self._elog_thread = None
+
+    def popElogBatch(self, timeout=None):
+        """Returns the next batch fetched by the ELOG streaming thread
+
+        Args:
+            timeout (float): Maximum time to wait in seconds, None to block
+        Returns:
+            Batch in the format of fetchElog, False if none is available
+        """
+        if self._elog_queue is None:
             return False
-        # Remove Header if Whitespace present
-        if ' ' in data:
-            data = data.split(' ')[1]
-        data = data.split(',')
-        num_ch = len(self.elogChannelList)+1
-        #print(len(data)/(1.0*num_ch), data)
-        num_items = int(len(data)/num_ch)
-        data = [data[i*num_ch:i*num_ch+num_ch] for i in range(num_items)]
-        return data
+        try:
+            return self._elog_queue.get(timeout=timeout)
+        except queue.Empty:
+            return False
+
+    def _elogReaderLoop(self, poll_interval, as_ndarray):
+        while not self._elog_stop.is_set():
+            try:
+                rows = self.fetchElog(as_ndarray)
+            except Exception:
+                # Keep fetching, the thread must not end unnoticed
+                log.exception("Fetching ELOG data failed")
+                rows = False
+            if rows is False:
+                # No new data available yet
+                self._elog_stop.wait(poll_interval)
+                continue
+            while not self._elog_stop.is_set():
+                try:
+                    self._elog_queue.put(rows, timeout=poll_interval)
+                    break
+                except queue.Full:
+                    pass
 
     def addMarker(self, label, description=None, time=None):
         if description is None and time is None:
@@ -571,7 +1260,7 @@ class OxygenSCPI:
         ret = self._askRaw(':CHANNEL:NAMES?')
         if ret:
             ch_str_list = ret.decode().strip()
-            ch_list = [item.replace('(','').replace(')','').replace('"','').split(',') for item in ch_str_list.split('),(')]
+            ch_list = [item.translate(_STRIP_PARENS_QUOTES).split(',') for item in ch_str_list.split('),(')]
             return ch_list
         else:
             return None
@@ -592,27 +1281,48 @@ class OxygenSCPI:
             return None
         
     def getChannelPropValue(self, channel_id, prop):
-        if type(channel_id) == int:
+        if isinstance(channel_id, int):
             channel_id = str(channel_id)
-        ret = self._askRaw(f':CHANNEL:PROP? "{channel_id:s}","{prop:s}"')
+        ret = self._askRaw(_TPL_PROP_GET % (channel_id.encode(), prop.encode()))
         if ret:
             return ret.decode().strip()
         else:
             return None
         
+    def getChannelProps(self, channel_id, props):
+        """Query several properties of a channel with a single compound query
+
+        Args:
+            channel_id (int or str): Channel ID
+            props (list of str): Property names
+        Returns:
+            Dict of property name and value, None on error
+        """
+        if isinstance(channel_id, int):
+            channel_id = str(channel_id)
+        channel_id = channel_id.encode()
+        cmd = b';'.join(_TPL_PROP_GET[:-1] % (channel_id, prop.encode()) for prop in props)
+        ret = self._askRaw(cmd + b'\n')
+        if ret:
+            values = ret.decode().strip().split(';')
+            if len(values) == len(props):
+                return dict(zip(props, values))
+        return None
+
     def getChannelPropNames(self, channel_id):
-        if type(channel_id) == int:
+        if isinstance(channel_id, int):
             channel_id = str(channel_id)
         ret = self._askRaw(f':CHANNEL:ITEM{channel_id:s}:ATTR:NAMES?')
         if ret:
-            return ret.decode().strip().replace('"','').split(",")
+            return ret.decode().strip().translate(_STRIP_QUOTES).split(",")
         else:
             return None
         
     def setChannelPropValue(self, channel_id, prop, val):
-        if type(channel_id) == int:
+        if isinstance(channel_id, int):
             channel_id = str(channel_id)
-        self._sendRaw(f':CHANNEL:PROP "{channel_id:s}","{prop:s}","{val:s}"')
+        self.ChannelProperties.invalidate(channel_id)
+        self._sendRaw(_TPL_PROP_SET % (channel_id.encode(), prop.encode(), val.encode()))
         
 
 # TODO: Better add and remove data stream instances            
@@ -620,27 +1330,23 @@ class OxygenScpiDataStream(object):
     def __init__(self, oxygen):
         self.oxygen = oxygen
         
-    def setItems(self, channelNames, streamGroup=1):
+    def setItems(self, channelNames, streamGroup=1, verify=True):
         """ Set Datastream Items to be transfered
+
+        With verify the channels accepted by the device are read back
         """
-        if not is_minimum_version(self.oxygen._scpi_version, (1,7)):
+        if not self.oxygen._has_v1_7:
             log.warn('SCPI Version 1.7 or higher required')
             return False
-        channelListStr = '"'+'","'.join(channelNames)+'"'
-        ret = self.oxygen._sendRaw(':DST:ITEM{:d} {:s}'.format(streamGroup, channelListStr))
-        sleep(0.1)
+        channelListStr = _format_channel_list(channelNames)
+        ret = self.oxygen._sendAndWait(':DST:ITEM{:d} {:s}'.format(streamGroup, channelListStr))
+        if not verify:
+            self.ChannelList = list(channelNames)
+            return ret and len(channelNames) > 0
         # Read back actual set channel names
         ret = self.oxygen._askRaw(':DST:ITEM{:d}?'.format(streamGroup))
         if isinstance(ret, bytes):
-            ret = ret.decode().strip()
-            ret = ret.replace(':DST:ITEM{:d} '.format(streamGroup),'')
-            channelNames = ret.split('","')
-            channelNames = [chName.replace('"','') for chName in channelNames]
-            if len(channelNames) == 1:
-                log.debug('One Channel Set: {:s}'.format(channelNames[0]))
-                if channelNames[0] == 'NONE':
-                    channelNames = []
-                    log.warn('No Channel Set')
+            channelNames = _parse_channel_list(ret)
             self.ChannelList = channelNames
             if len(channelNames) == 0:
                 return False
@@ -650,53 +1356,42 @@ class OxygenScpiDataStream(object):
             return False
         
     def setTcpPort(self, tcp_port, streamGroup=1):
-        self.oxygen._sendRaw(':DST:PORT{:d} {:d}'.format(streamGroup, tcp_port))
+        self.oxygen._sendRaw(_TPL_DST_PORT % (streamGroup, tcp_port))
         return True
         
-    def init(self, streamGroup=1):
+    def _sendDstCmd(self, verb, streamGroup):
+        """ Send a DST command to one stream group or to 'all'
+        """
         if streamGroup == 'all':
-            self.oxygen._sendRaw(':DST:INIT {:s}'.format(streamGroup))
-        elif type(streamGroup) == int:
-            self.oxygen._sendRaw(':DST:INIT {:d}'.format(streamGroup))
+            cmd = _DST_CMDS_ALL[verb]
+        elif isinstance(streamGroup, int):
+            cmd = _TPL_DST_CMD % (verb, streamGroup)
         else:
             return False
+        self.oxygen._sendRaw(cmd)
         return True
+
+    def init(self, streamGroup=1):
+        return self._sendDstCmd(b'INIT', streamGroup)
     
     def start(self, streamGroup=1):
-        if streamGroup == 'all':
-            self.oxygen._sendRaw(':DST:START ALL')
-        elif type(streamGroup) == int:
-            self.oxygen._sendRaw(':DST:START {:d}'.format(streamGroup))
-        else:
-            return False
-        return True
+        return self._sendDstCmd(b'START', streamGroup)
     
     def stop(self, streamGroup=1):
-        if streamGroup == 'all':
-            self.oxygen._sendRaw(':DST:STOP ALL')
-        elif type(streamGroup) == int:
-            self.oxygen._sendRaw(':DST:STOP {:d}'.format(streamGroup))
-        else:
-            return False
-        return True
+        return self._sendDstCmd(b'STOP', streamGroup)
     
     def getState(self, streamGroup=1):
-        ret = self.oxygen._askRaw(':DST:STAT{:d}?'.format(streamGroup))
+        ret = self.oxygen._askRaw(_TPL_DST_STATE % streamGroup)
         if isinstance(ret, bytes):
-            ret = ret.decode().strip()
-            ret = ret.replace(':DST:STAT ','')
-            return ret
+            return _strip_header(ret).decode()
         else:
             return False
         
     def setTriggered(self, streamGroup=1, value=True):
-        if value:
-            self.oxygen._sendRaw(':DST:TRIG{:d} ON'.format(streamGroup))
-        else:
-            self.oxygen._sendRaw(':DST:TRIG{:d} OFF'.format(streamGroup))
+        self.oxygen._sendRaw(_TPL_DST_TRIG % (streamGroup, b'ON' if value else b'OFF'))
         
     def reset(self):
-        self.oxygen._sendRaw(':DST:RESET')
+        self.oxygen._sendRaw(_CMD_DST_RESET)
 
 class OxygenChannelProperties(object):
     class OutputMode(Enum):
@@ -710,37 +1405,88 @@ class OxygenChannelProperties(object):
 
     def __init__(self, oxygen):
         self.oxygen = oxygen
+        self._prop_cache = {}
+
+    def _getCachedPropValue(self, ch_id, prop):
+        """
+        Query a channel property that rarely changes only once.
+        Call invalidate if the channel setup was changed elsewhere.
+        """
+        key = (str(ch_id), prop)
+        try:
+            return self._prop_cache[key]
+        except KeyError:
+            pass
+        ret = self.oxygen.getChannelPropValue(ch_id, prop)
+        if ret is not None:
+            self._prop_cache[key] = ret
+        return ret
+
+    def _getCachedPropValues(self, ch_id, props):
+        """
+        Like _getCachedPropValue, missing properties are queried together
+        """
+        ch_key = str(ch_id)
+        missing = [prop for prop in props if (ch_key, prop) not in self._prop_cache]
+        if missing:
+            ret = self.oxygen.getChannelProps(ch_id, missing)
+            if ret is None:
+                return None
+            for prop, value in ret.items():
+                self._prop_cache[(ch_key, prop)] = value
+        return [self._prop_cache[(ch_key, prop)] for prop in props]
+
+    def invalidate(self, ch_id=None):
+        """
+        Drop cached properties of one channel or of all channels if ch_id is None
+        """
+        if ch_id is None:
+            self._prop_cache.clear()
+            return
+        ch_id = str(ch_id)
+        for key in [key for key in self._prop_cache if key[0] == ch_id]:
+            del self._prop_cache[key]
 
     def getChannelType(self, ch_id):
-        return self.oxygen.getChannelPropValue(ch_id, 'ChannelType').split(',')[2].replace(')','').replace('"','')
+        return _prop_field(self._getCachedPropValue(ch_id, 'ChannelType'), 2)
 
     def getChannelSamplerate(self, ch_id):
         try:
-            return float(self.oxygen.getChannelPropValue(ch_id, 'SampleRate').split(',')[1].replace(')',''))
+            return float(_prop_field(self._getCachedPropValue(ch_id, 'SampleRate'), 1))
         except:
            return None
 
     def getTrionSlotNumber(self, ch_id):
         try:
-            return int(self.oxygen.getChannelPropValue(ch_id, 'ID:TRION/SlotNumber').split(',')[1].replace(')',''))
+            return int(_prop_field(self._getCachedPropValue(ch_id, 'ID:TRION/SlotNumber'), 1))
         except:
            return None
 
     def getTrionBoardId(self, ch_id):
         try:
-            return int(self.oxygen.getChannelPropValue(ch_id, 'ID:TRION/BoardId').split(',')[1].replace(')',''))
+            return int(_prop_field(self._getCachedPropValue(ch_id, 'ID:TRION/BoardId'), 1))
         except:
            return None
 
     def getTrionChannelIndex(self, ch_id):
         try:
-            return int(self.oxygen.getChannelPropValue(ch_id, 'ID:TRION/ChannelIndex').split(',')[1].replace(')',''))
+            return int(_prop_field(self._getCachedPropValue(ch_id, 'ID:TRION/ChannelIndex'), 1))
         except:
            return None
 
+    def getTrionIds(self, ch_id):
+        """
+        Slot number, board ID and channel index of a TRION channel with a single query
+        """
+        try:
+            values = self._getCachedPropValues(ch_id, ('ID:TRION/SlotNumber', 'ID:TRION/BoardId', 'ID:TRION/ChannelIndex'))
+            return tuple(int(_prop_field(value, 1)) for value in values)
+        except:
+            return None
+
     def getChannelDomainName(self, ch_id):
         try:
-            return self.oxygen.getChannelPropValue(ch_id, 'Neon/DomainUrl').split(',')[1].replace(')','').strip('"')
+            return _prop_field(self._getCachedPropValue(ch_id, 'Neon/DomainUrl'), 1)
         except:
             return ""
     
@@ -756,16 +1502,16 @@ class OxygenChannelProperties(object):
             ret = self.oxygen.getChannelPropValue(ch_id, 'LP_Filter_Freq')
             if ret == "NONE":
                 return None
-            ret_parts = ret.replace("(","").replace(")","").split(",")
+            ret_parts = ret.translate(_STRIP_PARENS_QUOTES).split(",")
             if ret_parts[0] == "STRING":
-                return ret_parts[1].replace('"',"")
+                return ret_parts[1]
             elif ret_parts[0] == "SCALAR":
                 return float(ret_parts[1])
         except:
             return None
 
     def getChannelUsed(self, ch_id):
-        ret = self.oxygen.getChannelPropValue(ch_id, 'Used').split(',')[1].strip(')"')
+        ret = _prop_field(self.oxygen.getChannelPropValue(ch_id, 'Used'), 1)
         if ret == "OFF":
             return False
         else:
@@ -773,7 +1519,7 @@ class OxygenChannelProperties(object):
 
     def getChannelRange(self, ch_id):
         try:
-            ret = float(self.oxygen.getChannelPropValue(ch_id, 'Range').split(',')[3].strip(')"'))
+            ret = float(_prop_field(self.oxygen.getChannelPropValue(ch_id, 'Range'), 3))
         except:
             ret = None
         return ret
@@ -797,14 +1543,15 @@ class OxygenChannelProperties(object):
         try:
             ret = self.oxygen.getChannelPropValue(ch_id, 'LP_Filter_Delay')
             print(ret)
-            ret = float(ret.split(',')[1].strip(')"'))/1e9 # Return in s instead of ns
+            ret = float(_prop_field(ret, 1))/1e9 # Return in s instead of ns
         except:
             ret = 0.0
         return ret
     
     def setTrionOutputFgenAmplitude(self, ch_id, amplitude, unit="V", amplitude_type="RMS"):
-        self.oxygen.setChannelPropValue(ch_id, "AmplitudeValue", amplitude_type)
-        self.oxygen.setChannelPropValue(ch_id, "TRION/Amplitude", f"{amplitude:f} {unit:s}")
+        with self.oxygen.batch():
+            self.oxygen.setChannelPropValue(ch_id, "AmplitudeValue", amplitude_type)
+            self.oxygen.setChannelPropValue(ch_id, "TRION/Amplitude", f"{amplitude:f} {unit:s}")
 
     def setTrionOutputFgenOffset(self, ch_id, offset, unit="V"):
         self.oxygen.setChannelPropValue(ch_id, "TRION/Offset", f"{offset:f} {unit:s}")
@@ -32,5 +32,6 @@ setuptools.setup(
     packages=["pyOxygenSCPI"],
     package_dir={"pyOxygenSCPI": "pyOxygenSCPI"},
     install_requires=[],
+    extras_require={"numpy": ["numpy"]},
     python_requires=">=3.6",
 )
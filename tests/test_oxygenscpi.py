@@ -0,0 +1,293 @@
+"""
+Tests of the response framing, using a socket pair or a local server as device
+"""
+import asyncio
+import datetime as dt
+import socket
+import struct
+import threading
+import unittest
+
+from pyOxygenSCPI import AsyncOxygenSCPI, OxygenSCPI, oxygenscpi
+
+
+def _connected(timeout=0.2):
+    device, client = socket.socketpair()
+    oxygen = OxygenSCPI('localhost', timeout=timeout)
+    oxygen._sock = client
+    return oxygen, device
+
+
+class TestResponseFraming(unittest.TestCase):
+    def setUp(self):
+        self.oxygen, self.device = _connected()
+
+    def tearDown(self):
+        self.oxygen.disconnect()
+        self.device.close()
+
+    def test_binary_block_containing_lf(self):
+        # First float (1.0000012) starts with an LF byte
+        payload = b'\x0a\x00\x80\x3f' + struct.pack('<f', 2.0)
+        self.device.sendall(b'#18' + payload + b'\n')
+        self.assertEqual(self.oxygen._askRaw(':NUM:NORM:VAL?'), b'#18' + payload + b'\n')
+
+    def test_block_larger_than_receive_buffer(self):
+        payload = b'\n\x00\x80\x3f' * 50000
+        response = b'#6200000' + payload + b'\n'
+        threading.Thread(target=self.device.sendall, args=(response,)).start()
+        self.assertEqual(self.oxygen._askRaw(':NUM:NORM:VAL?'), response)
+
+    def test_send_timeout_disconnects(self):
+        # The device does not read, the command is only partially sent
+        self.oxygen._sock.settimeout(0.2)
+        self.assertFalse(self.oxygen._sendRaw(b':MARK:ADD "' + b'x' * (1 << 24) + b'"\n'))
+        self.assertIsNone(self.oxygen._sock)
+
+    def test_responses_in_one_segment(self):
+        self.device.sendall(b'A\nB\n')
+        self.assertEqual(self.oxygen._askMany([':Q1?', ':Q2?']), [b'A\n', b'B\n'])
+
+    def test_late_responses_in_one_segment(self):
+        self.assertFalse(self.oxygen._askMany([':Q1?', ':Q2?']))
+        self.assertEqual(self.oxygen._stale_responses, 2)
+        # Both late responses and the next one arrive together
+        self.device.sendall(b'A\nB\nDEWETRON,OXYGEN\n')
+        self.assertEqual(self.oxygen.getIdn(), 'DEWETRON,OXYGEN')
+        self.assertEqual(self.oxygen._stale_responses, 0)
+
+    def test_batch_single_write(self):
+        with self.oxygen.batch():
+            self.oxygen.setRate(100)
+            self.oxygen.startElog()
+        self.assertEqual(self.device.recv(1024), b':RATE 100ms\n:ELOG:START\n')
+
+    def test_batch_dropped_on_error(self):
+        with self.assertRaises(ValueError):
+            with self.oxygen.batch():
+                self.oxygen.setRate(100)
+                raise ValueError()
+        self.oxygen.startElog()
+        self.assertEqual(self.device.recv(1024), b':ELOG:START\n')
+
+    def test_late_response_then_next_query(self):
+        self.assertFalse(self.oxygen.getIdn())
+        self.device.sendall(b'LATE\n')
+        self.device.sendall(b'DEWETRON,OXYGEN\n')
+        self.assertEqual(self.oxygen.getIdn(), 'DEWETRON,OXYGEN')
+
+    def test_missing_late_response_reconnects(self):
+        reconnected = []
+        def connect():
+            self.oxygen._sock, device = socket.socketpair()
+            reconnected.append(device)
+            return True
+        self.oxygen.connect = connect
+        self.assertFalse(self.oxygen._askRaw(':BOGUS?'))
+        for _ in range(self.oxygen._STALE_NUM_WAIT):
+            self.assertFalse(self.oxygen.getIdn())
+        self.assertIsNone(self.oxygen._sock)
+        self.assertEqual(self.oxygen._stale_responses, 0)
+        # The next command reconnects, no late response is expected there
+        self.assertTrue(self.oxygen._checkConnection())
+        reconnected[0].sendall(b'DEWETRON,OXYGEN\n')
+        self.assertEqual(self.oxygen.getIdn(), 'DEWETRON,OXYGEN')
+        reconnected[0].close()
+
+
+@unittest.skipIf(oxygenscpi.np is None, "NumPy not installed")
+class TestParseNumeric(unittest.TestCase):
+    def test_numbers(self):
+        self.assertEqual(oxygenscpi._parse_numeric(b'1.0,-2,3e1').tolist(), [1.0, -2.0, 30.0])
+
+    def test_blank_fields(self):
+        for data in (b'', b'\n', b'1.0, ,3', b'1.0,,3'):
+            self.assertIsNone(oxygenscpi._parse_numeric(data), data)
+
+    def test_values_with_blank_field(self):
+        oxygen = OxygenSCPI('localhost')
+        # No made up value, the raw token is returned
+        self.assertEqual(oxygen._parseValues(b':NUM:VAL \n'), ['\n'])
+        self.assertEqual(oxygen._parseValues(b'1.5,,2.5\n'), [1.5, '', 2.5])
+
+
+class TestParseTimestamp(unittest.TestCase):
+    # The regular expression parser is the only one before Python 3.11
+    parsers = (oxygenscpi._parse_timestamp_re, oxygenscpi._parse_timestamp)
+
+    def _assertParsed(self, val, expected):
+        for parse in self.parsers:
+            self.assertEqual(parse(val), expected, parse.__name__)
+            self.assertEqual(parse(val).utcoffset(), expected.utcoffset(), parse.__name__)
+
+    def test_variable_length_fraction(self):
+        tz = dt.timezone(dt.timedelta(hours=2))
+        self._assertParsed('"2017-10-10T12:16:52.33136+02:00"',
+                           dt.datetime(2017, 10, 10, 12, 16, 52, 331360, tz))
+        self._assertParsed('2017-10-10T12:16:52.5+02:00',
+                           dt.datetime(2017, 10, 10, 12, 16, 52, 500000, tz))
+        # Digits beyond microseconds are cut off
+        self._assertParsed('2017-10-10T12:16:52.3313612+02:00',
+                           dt.datetime(2017, 10, 10, 12, 16, 52, 331361, tz))
+
+    def test_missing_fraction(self):
+        tz = dt.timezone(dt.timedelta(hours=2))
+        self._assertParsed('2017-10-10T12:16:52+02:00',
+                           dt.datetime(2017, 10, 10, 12, 16, 52, 0, tz))
+
+    def test_negative_offset(self):
+        tz = dt.timezone(-dt.timedelta(hours=5, minutes=30))
+        self._assertParsed('2017-10-10T12:16:52.25-05:30',
+                           dt.datetime(2017, 10, 10, 12, 16, 52, 250000, tz))
+
+    def test_invalid(self):
+        for val in ('', 'Stopped', '2017-10-10T25:16:52+02:00'):
+            for parse in self.parsers:
+                with self.assertRaises(ValueError, msg=(parse.__name__, val)):
+                    parse(val)
+
+
+class TestParseAsciiTokens(unittest.TestCase):
+    def setUp(self):
+        self.oxygen = OxygenSCPI('localhost')
+
+    def test_numbers(self):
+        self.assertEqual(self.oxygen._parse_ascii_tokens([b'1.5', b'-2']), [1.5, -2.0])
+
+    def test_timestamp_column(self):
+        self.oxygen._setTransferChannelList(['ABS-TIME', 'AI 1/1'])
+        values = self.oxygen._parse_ascii_tokens([b'"2017-10-10T12:16:52.5+02:00"', b'1.5'])
+        self.assertEqual(values[0].isoformat(), '2017-10-10T12:16:52.500000+02:00')
+        self.assertEqual(values[1], 1.5)
+
+    def test_text_and_unknown_timestamp(self):
+        values = self.oxygen._parse_ascii_tokens(
+            [b'1.5', b'"2017-10-10T12:16:52.5+02:00"', b'NaN?', b''])
+        self.assertEqual(values[0], 1.5)
+        self.assertEqual(values[1].isoformat(), '2017-10-10T12:16:52.500000+02:00')
+        self.assertEqual(values[2:], ['NaN?', ''])
+
+
+class TestChannelPropertiesCache(unittest.TestCase):
+    def setUp(self):
+        self.oxygen = OxygenSCPI('localhost')
+        self.queries = []
+        self.oxygen.getChannelPropValue = self._getChannelPropValue
+        self.oxygen._sendRaw = lambda cmd: True
+
+    def _getChannelPropValue(self, channel_id, prop):
+        self.queries.append((channel_id, prop))
+        return '(SCALAR,{:d},"Hz")'.format(1000 * len(self.queries))
+
+    def test_cached(self):
+        props = self.oxygen.ChannelProperties
+        self.assertEqual(props.getChannelSamplerate(1), 1000.0)
+        self.assertEqual(props.getChannelSamplerate(1), 1000.0)
+        self.assertEqual(len(self.queries), 1)
+
+    def test_invalidated(self):
+        props = self.oxygen.ChannelProperties
+        props.getChannelSamplerate(1)
+        self.oxygen.setChannelPropValue(1, 'SampleRate', '2000')
+        self.assertEqual(props.getChannelSamplerate(1), 2000.0)
+        self.oxygen.loadSetup('test.dms')
+        self.assertEqual(props.getChannelSamplerate(1), 3000.0)
+        self.oxygen.reset()
+        self.assertEqual(props.getChannelSamplerate(1), 4000.0)
+
+
+def _run(coro):
+    # asyncio.run is not available on Python 3.6
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+class _FakeDevice(threading.Thread):
+    """
+    TCP server answering known queries, one thread per connection
+    """
+    def __init__(self, responses):
+        super().__init__(daemon=True)
+        self.responses = dict(responses)
+        self.responses.setdefault(b'*VER?', b'SCPI,"1999.0",RC_SCPI,"1.20",OXYGEN,"7.0"\n')
+        self.connections = 0
+        self.listener = socket.socket()
+        self.listener.bind(('127.0.0.1', 0))
+        self.listener.listen(8)
+        self.port = self.listener.getsockname()[1]
+        self.start()
+
+    def run(self):
+        while True:
+            try:
+                conn, _ = self.listener.accept()
+            except OSError:
+                return
+            self.connections += 1
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        with conn, conn.makefile('rb') as lines:
+            for line in lines:
+                response = self.responses.get(line.strip())
+                if response is not None:
+                    conn.sendall(response)
+
+    def close(self):
+        self.listener.close()
+
+
+class TestAsyncInterface(unittest.TestCase):
+    def test_blocking_methods_not_exposed(self):
+        oxygen = AsyncOxygenSCPI('localhost')
+        for name in ('enableBinaryValues', 'getAcquisitionState', 'storeWait',
+                     'batch', 'DataStream', 'ChannelProperties'):
+            self.assertFalse(hasattr(oxygen, name), name)
+
+    def test_transfer_channels(self):
+        async def run():
+            device, client = socket.socketpair()
+            oxygen = AsyncOxygenSCPI('localhost', timeout=1)
+            oxygen._reader, oxygen._writer = await asyncio.open_connection(sock=client)
+            device.sendall(b'"REL-TIME","AI 1/1"\n')
+            ret = await oxygen.setTransferChannels(['AI 1/1', 'AI 1/2'], includeRelTime=True)
+            await oxygen.disconnect()
+            sent = device.recv(1024)
+            device.close()
+            return ret, oxygen.channelList, sent
+        ret, channels, sent = _run(run())
+        # The rejected channel is removed from the transferred number
+        self.assertTrue(ret)
+        self.assertEqual(channels, ['REL-TIME', 'AI 1/1'])
+        self.assertTrue(sent.endswith(b':NUM:NORMAL:NUMBER 2\n'))
+
+    def test_response_larger_than_block_size(self):
+        rows = ['{:d}.0,1.5'.format(idx) for idx in range(5000)]
+        device = _FakeDevice({b':ELOG:FETCH?': (','.join(rows) + '\n').encode()})
+        self.addCleanup(device.close)
+        async def run():
+            oxygen = AsyncOxygenSCPI('127.0.0.1', device.port, timeout=2, block_size=4096)
+            oxygen.elogChannelList = ['AI 1/1']
+            ret = await oxygen.fetchElog()
+            await oxygen.disconnect()
+            return ret
+        ret = _run(run())
+        self.assertEqual(len(ret), 5000)
+        self.assertEqual(ret[-1], ['4999.0', '1.5'])
+
+    def test_concurrent_connect(self):
+        device = _FakeDevice({b'*IDN?': b'DEWETRON,OXYGEN,0,7.0\n'})
+        self.addCleanup(device.close)
+        async def run():
+            oxygen = AsyncOxygenSCPI('127.0.0.1', device.port, timeout=2)
+            ret = await asyncio.gather(oxygen.getIdn(), oxygen.getIdn(), oxygen.getIdn())
+            await oxygen.disconnect()
+            return ret
+        self.assertEqual(_run(run()), ['DEWETRON,OXYGEN,0,7.0'] * 3)
+        self.assertEqual(device.connections, 1)
+
+if __name__ == '__main__':
+    unittest.main()